@@ -1,6 +1,13 @@
+import BaseHTTPServer
 import collections
 import copy
+import json
+import math
+import os
 import random
+import resource
+import threading
+import time
 
 random.seed()
 
@@ -20,6 +27,10 @@ class Strategy(object):
     def get_discard(self, player, game):
         return self._discard_strategy.get_discard(player, game)
 
+    def reset(self):
+        """ Called before each game so a strategy can be reused across games. """
+        self._last_seen_hand = None
+
     def look_at(self, target):
         self._last_seen_hand = {
                     'target'    : target.number,
@@ -277,6 +288,13 @@ class Player(object):
         self._number = number
         self._strat  = strategy
 
+    def reset(self, card):
+        """ Readies this player for a new game holding card, reusing the existing hand and discard lists. """
+        del self._hand[:]
+        self._hand.append(card)
+        del self._discard_pile[:]
+        self._strat.reset()
+
     def play(self, game):
         drawn_card = game.deck().draw()
         self._hand.append(drawn_card)
@@ -491,7 +509,12 @@ class Deck:
     # ]
 
     def __init__(self):
-        self._cards = copy.deepcopy(Deck.CANONICAL_DECK)
+        self._all_cards = copy.deepcopy(Deck.CANONICAL_DECK)
+        self._cards     = list(self._all_cards)
+
+    def reset(self):
+        """ Puts every card back into the deck, unshuffled, without allocating a new deck. """
+        self._cards[:] = self._all_cards
 
     def shuffle(self):
         random.shuffle(self._cards)
@@ -507,18 +530,39 @@ class Deck:
 class Game:
     def __init__(self, players_strategies):
         self._deck          = Deck()
-        self._deck.shuffle()
 
-        self._players       = []
+        self._seats         = []
         for n in range(len(players_strategies)):
-            self._players.append(Player(self._deck.draw(), n, players_strategies[n]))
-
-        self._burn_card      = self._deck.draw()
+            self._seats.append(Player(None, n, players_strategies[n]))
 
+        self._players        = []
         self._losers         = []
         self._protected      = []
         self._log            = []
+        self.reset()
+
+    def reset(self, seed=None):
+        """ Starts a fresh game, reusing this game's deck, players and strategies in place.
+            If seed is given, the random module is reseeded first so the deal and play can be reproduced. """
+        if seed is not None:
+            random.seed(seed)
+
+        self._deck.reset()
+        self._deck.shuffle()
+
+        del self._players[:]
+        for player in self._seats:
+            player.reset(self._deck.draw())
+            self._players.append(player)
+
+        self._burn_card      = self._deck.draw()
+
+        del self._losers[:]
+        del self._protected[:]
+        del self._log[:]
+        self._current_player = None
         self._current_player_is_out = False
+        self._turns          = 0
 
     # Don't call unless is_game_over confirms the game is over.
     def winner(self):
@@ -586,6 +630,7 @@ class Game:
             self._players.append(current_player)
 
         self._current_player = None
+        self._turns += 1
         self.log("Player " + str(current_player.number()) + "'s turn ended.")
 
 
@@ -662,18 +707,178 @@ class Game:
         self.log_error("Tried to find a player, but got None!")
         return None
 
-def play_game():
-    game = Game([LowestDiscardStrategy(),
-                BestGuessStrategy()])
+    def turns(self):
+        return self._turns
+
+def wilson_interval(wins, games, z=1.96):
+    """ Returns the (low, high) Wilson score interval for a win rate of wins / games. """
+    if games == 0:
+        return (0.0, 1.0)
+    p = float(wins) / games
+    denominator = 1 + z * z / games
+    center = (p + z * z / (2 * games)) / denominator
+    spread = z * math.sqrt(p * (1 - p) / games + z * z / (4 * games * games)) / denominator
+    return (max(0.0, center - spread), min(1.0, center + spread))
+
+class SimulationMetrics(object):
+    """ Counters for a running simulation. Updated once per finished game, so recording is cheap;
+        everything derived (rates, intervals) is computed only when a snapshot is requested. """
+    def __init__(self, num_players):
+        self._lock       = threading.Lock()
+        self._start_time = time.time()
+        self._games      = 0
+        self._turns      = 0
+        self._wins       = [0] * num_players
+        self._workers    = {}
+
+    def record_game(self, winner, turns, worker='main'):
+        now = time.time()
+        with self._lock:
+            self._games += 1
+            self._turns += turns
+            self._wins[winner.number()] += 1
+            stats = self._workers.get(worker)
+            if stats is None:
+                stats = self._workers[worker] = {'games' : 0, 'first_game' : now, 'last_game' : now}
+            stats['games']    += 1
+            stats['last_game'] = now
+
+    def snapshot(self):
+        with self._lock:
+            games   = self._games
+            turns   = self._turns
+            wins    = list(self._wins)
+            workers = dict((name, dict(stats)) for name, stats in self._workers.items())
+
+        now = time.time()
+        elapsed = now - self._start_time
+
+        win_rates = []
+        for n in range(len(wins)):
+            low, high = wilson_interval(wins[n], games)
+            rate = 0.0
+            if games > 0:
+                rate = float(wins[n]) / games
+            win_rates.append({'player' : n, 'wins' : wins[n], 'rate' : rate, 'low' : low, 'high' : high})
+
+        worker_stats = {}
+        for name, stats in workers.items():
+            worker_elapsed = now - stats['first_game']
+            games_per_second = 0.0
+            if worker_elapsed > 0:
+                games_per_second = stats['games'] / worker_elapsed
+            worker_stats[name] = {
+                        'games'                  : stats['games'],
+                        'games_per_second'       : games_per_second,
+                        'seconds_since_last_game': now - stats['last_game']
+                    }
+
+        games_per_second = 0.0
+        if elapsed > 0:
+            games_per_second = games / elapsed
+
+        average_turns = 0.0
+        if games > 0:
+            average_turns = float(turns) / games
+
+        # ru_maxrss is reported in kilobytes on Linux.
+        max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        return {
+                    'elapsed_seconds'  : elapsed,
+                    'games_completed'  : games,
+                    'games_per_second' : games_per_second,
+                    'average_turns'    : average_turns,
+                    'win_rates'        : win_rates,
+                    'workers'          : worker_stats,
+                    'max_rss_kb'       : max_rss_kb
+                }
+
+    def prometheus_text(self):
+        snapshot = self.snapshot()
+        lines = [
+            "# TYPE loveletter_games_completed_total counter",
+            "loveletter_games_completed_total " + str(snapshot['games_completed']),
+            "# TYPE loveletter_games_per_second gauge",
+            "loveletter_games_per_second " + repr(snapshot['games_per_second']),
+            "# TYPE loveletter_average_turns gauge",
+            "loveletter_average_turns " + repr(snapshot['average_turns']),
+            "# TYPE loveletter_max_rss_kilobytes gauge",
+            "loveletter_max_rss_kilobytes " + str(snapshot['max_rss_kb']),
+        ]
+        for name, key in (('win_rate', 'rate'), ('win_rate_low', 'low'), ('win_rate_high', 'high')):
+            lines.append("# TYPE loveletter_" + name + " gauge")
+            for win_rate in snapshot['win_rates']:
+                lines.append('loveletter_' + name + '{player="' + str(win_rate['player']) + '"} ' + repr(win_rate[key]))
+        workers = sorted(snapshot['workers'].items())
+        for name, kind in (('games', 'counter'), ('games_per_second', 'gauge'), ('seconds_since_last_game', 'gauge')):
+            metric = 'loveletter_worker_' + name
+            if name == 'games':
+                metric += '_total'
+            lines.append("# TYPE " + metric + " " + kind)
+            for worker, stats in workers:
+                lines.append(metric + '{worker="' + worker + '"} ' + repr(stats[name]))
+        return "\n".join(lines) + "\n"
+
+class MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        metrics = self.server.metrics
+        if self.path == '/metrics':
+            body = metrics.prometheus_text()
+            content_type = 'text/plain; version=0.0.4'
+        elif self.path in ('/', '/json'):
+            body = json.dumps(metrics.snapshot(), indent=2, sort_keys=True)
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Keep request logging out of the simulation output.
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(metrics, port, host='127.0.0.1'):
+    """ Serves metrics on host:port from a daemon thread: JSON at / and Prometheus text at /metrics. """
+    server = BaseHTTPServer.HTTPServer((host, port), MetricsRequestHandler)
+    server.metrics = metrics
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+def play_game(game=None, metrics=None):
+    """ Plays game to completion, building a new one if none is given. A finished game can be reused by calling reset() on it. """
+    if game is None:
+        game = Game([LowestDiscardStrategy(),
+                    BestGuessStrategy()])
     while not game.is_game_over():
         print game.status()
         game.do_turn()
-    return game.winner()
-
+    winner = game.winner()
+    if metrics is not None:
+        metrics.record_game(winner, game.turns())
+    return winner
+
+# Set LOVE_LETTER_METRICS_PORT to expose live metrics while the simulation runs.
+metrics = SimulationMetrics(num_players=2)
+metrics_port = os.environ.get('LOVE_LETTER_METRICS_PORT')
+if metrics_port:
+    start_metrics_server(metrics, int(metrics_port))
+
+game = Game([LowestDiscardStrategy(),
+             BestGuessStrategy()])
 win_tablulation = [0, 0, 0, 0]
 for n in range(10000):
     print "===== Game Begin ====="
-    winner = play_game()
+    if n > 0:
+        game.reset()
+    winner = play_game(game, metrics)
     win_tablulation[winner.number()] += 1
     print "=====  Game End  ====="
 